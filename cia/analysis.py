@@ -20,25 +20,67 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import hashlib
 import logging
 from datetime import timezone
 
+import numpy as np
 import pandas as pd
 
 
 log = logging.getLogger(__name__)
 
 
+# Results of calc_rolling_event_rate(..., cache=True), keyed by fingerprint of
+# the input. Bounded: oldest entry is evicted first.
+_EVENT_RATE_CACHE = {}
+_EVENT_RATE_CACHE_MAXSIZE = 32
+
+
 def calc_rolling_event_rate(
     series,
     window_width_seconds,
     upsample_with_zeros=False,
     upsample_with_zeros_until=None,
+    cache=False,
 ):
     """
     Require that Series index is a timestamp index.
     http://pandas.pydata.org/pandas-docs/version/0.19.2/api.html#window
+
+    `cache`: if `True`, return a copy of a previously computed result for the
+    same input (only the index of `series` is relevant) and parameters.
     """
+    if not cache:
+        return _calc_rolling_event_rate(
+            series, window_width_seconds, upsample_with_zeros, upsample_with_zeros_until
+        )
+
+    h = hashlib.blake2b(series.index.asi8.tobytes(), digest_size=16)
+    h.update(repr(series.index.tz).encode())
+    key = (
+        h.digest(),
+        window_width_seconds,
+        upsample_with_zeros,
+        repr(upsample_with_zeros_until),
+    )
+    if key not in _EVENT_RATE_CACHE:
+        if len(_EVENT_RATE_CACHE) >= _EVENT_RATE_CACHE_MAXSIZE:
+            del _EVENT_RATE_CACHE[next(iter(_EVENT_RATE_CACHE))]
+        _EVENT_RATE_CACHE[key] = _calc_rolling_event_rate(
+            series, window_width_seconds, upsample_with_zeros, upsample_with_zeros_until
+        )
+    else:
+        log.info("calc_rolling_event_rate: use cached result")
+    return _EVENT_RATE_CACHE[key].copy()
+
+
+def _calc_rolling_event_rate(
+    series,
+    window_width_seconds,
+    upsample_with_zeros,
+    upsample_with_zeros_until,
+):
     assert isinstance(window_width_seconds, int)
     log.info(
         "Calculate event rate over rolling window (width: %s s)", window_width_seconds
@@ -46,32 +88,38 @@ def calc_rolling_event_rate(
 
     # Each sample/item in the series corresponds to one event. The index value
     # is the datetime of the event (build), with a resolution of 1 second
-    # (assumption about input). Multiple events per second are rare, but to be
-    # expected: hence, get the number of events for any given second (group by
-    # index value, and get the group size for each unique index value).
-    eventcountseries = series.groupby(series.index).size()
-
-    # Rename to `e` for the following transformations.
-    e = eventcountseries
-
-    log.info("raw event count series (raw series.groupby(series.index).size()):")
-    print(e)
-
+    # (assumption about input). Count the number of events falling into each
+    # N-minute bin (bins aligned to the full hour, labeled by their left
+    # edge, like `e.resample(f"{n_minute_bins}min").sum()` applied to the
+    # number of events per unique index value). Do that with `np.bincount()`
+    # on the bin number of each event (timedelta integer division, which
+    # does not depend on the index' time unit): no hashing/grouping of
+    # Timestamp objects. After this, the time difference between adjacent
+    # data points is exactly `n_minute`s; bins without events have a count
+    # of 0.
     n_minute_bins = 60
-    log.info("downsample series into %s-minute bins", n_minute_bins)
-    # Downsample the series into N-minute bins and sum the values falling into
-    # a bin (counting the number of 'events' in this bin). Note(double-check,
-    # but I think that's right): after this, the minimal time difference
-    # between adjacent data points is `n_minute`s, and the maximal one is
-    # unknown (can be large, this does not fill gaps).
-    e = e.resample(f"{n_minute_bins}min").sum()
+    log.info("count events in %s-minute bins", n_minute_bins)
+    bin_freq = f"{n_minute_bins}min"
+    first_bin_start = series.index.min().floor(bin_freq)
+    counts = np.bincount(
+        ((series.index - first_bin_start) // pd.Timedelta(minutes=n_minute_bins))
+        .to_numpy()
+        .astype(np.int64)
+    )
+    e = pd.Series(
+        counts,
+        index=pd.date_range(start=first_bin_start, periods=len(counts), freq=bin_freq),
+    )
+
+    # Rendering a long Series as text is expensive: only do so when it is
+    # going to be emitted.
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("event count series (number of events per bin):\n%s", e)
     # print(e)
 
-    # The 'resample' before is not expected to upsample, just downsample. That
-    # is, the resulting time index is expected to have gaps (where no events
-    # occur in a time interval wider than the bin width above), Up-sample the
-    # time index to fill these gaps, with a certain desired resolution and fill
-    # the missing values with zeros. If desired.
+    # The bins above cover the time range of the events in `series`, gaps are
+    # already filled with zeros. If desired, extend the series (with zeros)
+    # up to `upsample_with_zeros_until`.
     if upsample_with_zeros:
         if upsample_with_zeros_until is not None:
             if series.index.max() == upsample_with_zeros_until:
@@ -98,7 +146,10 @@ def calc_rolling_event_rate(
                     dp,
                 )
                 # print(f"e before: {e}")
-                e = e.append(dp)
+                # Extend the index by the new (newest) data point, filling
+                # its value with zero (instead of the deprecated, copying
+                # `Series.append()`).
+                e = e.reindex(e.index.union(dp.index), fill_value=0)
                 # print(f"e after: {e}")
                 # Example state after this extension: last to samples in `e`:
                 #    2020-12-07 12:00:00+00:00    4
@@ -114,13 +165,15 @@ def calc_rolling_event_rate(
     datetime_newest_datapoint = e.index.max()
     log.info("newest data point in event count series: %s", datetime_newest_datapoint)
 
-    # Construct Window object using `df.rolling()` whereas a time offset string
-    # defines the rolling window width in seconds. Require N samples to be in
-    # the moving window otherwise produce NaN?
-    window = e.rolling(window="%sS" % window_width_seconds, min_periods=1)
-
-    # Count the number of events (builds) within the rolling window.
-    s = window.sum()
+    # Count the number of events (builds) within the rolling window. By now,
+    # `e` has a regular time index (one sample per `n_minute_bins` minutes),
+    # and so a time window of width `window_width_seconds` (right-closed,
+    # like for `e.rolling(window="%sS")`) corresponds to a fixed number of
+    # samples (at least one: the sample itself).
+    n_samples_per_window = max(1, -(-window_width_seconds // (n_minute_bins * 60)))
+    s = pd.Series(
+        rolling_sum_fixed_window(e.to_numpy(), n_samples_per_window), index=e.index
+    )
 
     # Normalize event count with/by the window width, yielding the average
     # build rate [Hz] in that time window.
@@ -139,11 +192,14 @@ def calc_rolling_event_rate(
     # of multiple rolling window series in the same plot -- keeping the
     # symmetry of original data is especially important when doing long term
     # analysis, with wide time windows with varying window width varies.
-    # However: invoking `rolling(..., center=True)` however yields
-    # `NotImplementedError: center is not implemented for datetimelike and
-    # offset based windows`. As a workaround, shift the data by half the window
-    # size to 'the left': shift the timestamp index by a constant / offset.
-    offset = pd.DateOffset(seconds=window_width_seconds / 2.0)
+    # The window sum above is computed over a fixed number of samples, so
+    # centering could be done in terms of samples (like `rolling(k,
+    # center=True)`), but that is only exact for an odd number of samples per
+    # window and drops the newest `k/2` results. Instead, shift the data by
+    # half the window width to 'the left': shift the timestamp index by a
+    # constant. A fixed Timedelta (unlike a calendar-aware DateOffset) makes
+    # this a single int64 array subtraction.
+    offset = pd.Timedelta(seconds=window_width_seconds / 2.0)
     rolling_event_rate_d.index = rolling_event_rate_d.index - offset
 
     # In the resulting time series, all leftmost values up to the rolling
@@ -169,21 +225,21 @@ def calc_rolling_event_rate(
 
     # print(rolling_event_rate_d.index.max())
     # now = pd.Timestamp.now(tz=timezone.utc)
-    apdx_index = pd.date_range(
-        start=rolling_event_rate_d.index.max(),
+    # The time index is regular (one sample per `n_minute_bins` minutes):
+    # extend it with the same frequency up to the newest data point, and
+    # forward-fill the new samples in a single reindex operation.
+    full_index = pd.date_range(
+        start=rolling_event_rate_d.index.min(),
         end=datetime_newest_datapoint,
         freq=f"{n_minute_bins}min",
     )
-    apdx_series = pd.Series([apdx_last_value] * len(apdx_index), index=apdx_index)
-    # print(apdx_index)
-    # print(apdx_series)
 
     log.info(
         "rolling_event_rate_d: forward-fill to %s with last value %s",
         datetime_newest_datapoint,
         apdx_last_value,
     )
-    rolling_event_rate_d = rolling_event_rate_d.append(apdx_series)
+    rolling_event_rate_d = rolling_event_rate_d.reindex(full_index, method="ffill")
 
     # df.set_index("dt").reindex(r).fillna(0.0).rename_axis("dt").reset_index()
 
@@ -209,3 +265,67 @@ def calc_rolling_event_rate(
     # print(rolling_event_rate_d)
 
     return rolling_event_rate_d
+
+
+def rolling_sum_fixed_window(values, window_size):
+    """
+    Return the rolling sum over `values` (1D numpy array), using a window of
+    `window_size` samples (including the current one). For the first
+    `window_size - 1` samples the window is only partially filled (like for
+    `rolling(..., min_periods=1)`).
+
+    O(N), independent of `window_size`: based on the cumulative sum, the sum
+    over a window is the difference of two cumulative sums.
+    """
+    csum = np.cumsum(values)
+    result = csum.copy()
+    result[window_size:] -= csum[:-window_size]
+    return result
+
+
+def downsample_to_pixel_grid(series, width_px, height_px, ylog=False):
+    """
+    Reduce a time series for plotting it with markers: divide the time and
+    value range of `series` into a grid of `width_px` x `height_px` cells,
+    and keep only the first data point of each cell (in time order).
+
+    If each cell is not larger than a pixel of the output image, then all
+    data points in a cell are drawn less than a pixel apart, i.e. on top of
+    each other: plotting one of them looks the same as plotting all of them.
+
+    `ylog`: the values are plotted on a log scale; lay out the grid in
+    log space. Non-positive values cannot be shown on a log scale, drop
+    them.
+    """
+    series = series.dropna()
+    if ylog:
+        series = series[series > 0]
+    if len(series) < 2:
+        return series
+
+    t = series.index.asi8.astype(np.float64)
+    values = series.to_numpy(dtype=np.float64)
+    if ylog:
+        values = np.log10(values)
+
+    def _cellnum(x, n_cells):
+        span = x.max() - x.min()
+        if span == 0:
+            return np.zeros(len(x), dtype=np.int64)
+        cellnum = ((x - x.min()) / span * n_cells).astype(np.int64)
+        # The maximum would be in cell `n_cells` otherwise.
+        return np.minimum(cellnum, n_cells - 1)
+
+    cellnum = _cellnum(t, width_px) * height_px + _cellnum(values, height_px)
+    _, first_pos = np.unique(cellnum, return_index=True)
+    if len(first_pos) == len(series):
+        return series
+
+    log.info(
+        "downsample series to pixel grid (%s x %s): %s -> %s data points",
+        width_px,
+        height_px,
+        len(series),
+        len(first_pos),
+    )
+    return series.iloc[np.sort(first_pos)]
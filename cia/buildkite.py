@@ -24,16 +24,27 @@
 Buildkite-specific dingeling.
 """
 
+import functools
 import os
 import logging
+import multiprocessing
+import operator
 import sys
 import time
 from collections import Counter, defaultdict
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
+import numpy as np
 import pandas as pd
 from pybuildkite.buildkite import Buildkite, BuildState
 
+import matplotlib
+
+# Figures are only ever written to PNG files. Select the non-interactive Agg
+# backend before pyplot gets imported (here or via cia.plot) so that no GUI
+# backend is probed for.
+matplotlib.use("Agg")
+
 import matplotlib.pyplot as plt
 
 import cia.plot as plot
@@ -46,12 +57,48 @@ from cia.cfg import CFG, TODAY
 log = logging.getLogger(__name__)
 
 
-BK_CLIENT = Buildkite()
-BK_CLIENT.set_access_token(os.environ["BUILDKITE_API_TOKEN"])
-
-
 _PLOTS_FOR_SUBPLOTS = []
 
+# Properties of build and job objects used by the analysis. Only these are
+# kept in memory and in the cache file; the remaining ones (commit message,
+# creator, agent details, env, ...) make up most of an API response.
+_BUILD_PROPS = (
+    "number",
+    "state",
+    "created_at",
+    "scheduled_at",
+    "started_at",
+    "finished_at",
+    "jobs",
+)
+_JOB_PROPS = (
+    "id",
+    "type",
+    "step_key",
+    "state",
+    "created_at",
+    "scheduled_at",
+    "started_at",
+    "finished_at",
+)
+
+
+@functools.lru_cache(maxsize=1)
+def bk_client():
+    """
+    Return the Buildkite API client, created upon first use: runs that are
+    served from the (fresh) builds cache do not need it, and do not need the
+    BUILDKITE_API_TOKEN environment variable to be set.
+    """
+    client = Buildkite()
+    client.set_access_token(os.environ["BUILDKITE_API_TOKEN"])
+    return client
+
+
+# Maximum number of response pages requested concurrently from the Buildkite
+# API when fetching builds.
+_FETCH_CONCURRENCY = 8
+
 
 def main():
 
@@ -61,38 +108,51 @@ def main():
 
     builds = bfilter.drop_builds_that_did_not_start_or_finish(builds)
 
+    # Sort by start time, from past to future. Do this once here (all
+    # subsequent filters preserve order) so that the DataFrames constructed
+    # from (subsets of) `builds` do not need to be sorted again.
+    builds.sort(key=operator.itemgetter("started_at"))
+
     builds = bfilter.filter_builds_based_on_build_time(builds)
 
     build_numbers = sorted([b["number"] for b in builds])
     log.info("build numbers: %s ... %s", build_numbers[0:5], build_numbers[-5:-1])
 
-    set_common_x_limit_for_plotting(builds)
+    builds_passed = bfilter.filter_builds_passed_based_on_duration(builds)
+
+    # Construct the (columnar) DataFrame representation of all builds and of
+    # passed builds once; the analysis steps below share these.
+    df_all = construct_df_for_builds(builds)
+    df_passed = construct_df_for_builds(builds_passed)
+
+    set_common_x_limit_for_plotting(df_all)
 
     plot.matplotlib_config()
 
-    builds_passed = bfilter.filter_builds_passed(
-        bfilter.filter_builds_based_on_duration(builds)
-    )
+    mode = CFG().args.mode
 
-    p = plot.PlotBuildrate(
-        builds_map={
-            "all builds": construct_df_for_builds(builds),
-            "passed builds": construct_df_for_builds(builds_passed),
-        },
-        window_width_days=4,
-        context_descr=f"{CFG().args.org}/{CFG().args.pipeline}",
-    )
-    p.plot_mpl_singlefig()
-    _PLOTS_FOR_SUBPLOTS.append(p)
+    if mode in ("rate", "all"):
+        p = plot.PlotBuildrate(
+            builds_map={
+                "all builds": df_all,
+                "passed builds": df_passed,
+            },
+            window_width_days=4,
+            context_descr=f"{CFG().args.org}/{CFG().args.pipeline}",
+        )
+        _PLOTS_FOR_SUBPLOTS.append(p)
+
+        analyze_build_stability(df_all, df_passed, window_width_days=4)
 
-    analyze_build_stability(builds, builds_passed, window_width_days=4)
+    if mode in ("jobs", "all"):
+        analyze_passed_builds(builds_passed, df_passed)
 
-    analyze_passed_builds(builds)
+    # Each plot is drawn twice: into a single figure, and as a subplot into
+    # the summary figure. Render all single figures in one go (in parallel).
+    plot_mpl_singlefigs(_PLOTS_FOR_SUBPLOTS)
 
     create_summary_fig_with_subplots()
 
-    # plot.show_ax_objs_info()
-    # plot.subplots_from_axs_objs()
     # plt.show()
     sys.exit(0)
 
@@ -105,24 +165,22 @@ def create_summary_fig_with_subplots():
     # w, h
     fig.set_size_inches(10, 1.5 * n_rows)
 
-    log.info("create figure with subplots for these:")
-    for p in _PLOTS_FOR_SUBPLOTS:
-        print(p)
+    log.info(
+        "create figure with subplots for these: %s",
+        ", ".join(p.__class__.__name__ for p in _PLOTS_FOR_SUBPLOTS),
+    )
 
     # hard-code: 1 column
-    new_axs = fig.subplots(n_rows, 1, sharex=True)
+    # `squeeze=False`: also get a sequence of Axes objects for a single row.
+    new_axs = fig.subplots(n_rows, 1, sharex=True, squeeze=False)[:, 0]
     for p, ax in zip(_PLOTS_FOR_SUBPLOTS, new_axs):
         log.debug("re-plot %s to ax %s", p, id(ax))
-        # Set currently active axis to axis object handed over to this
-        # function. That makes df.plot() add the data to said axis.
-        # Also pass `ax` explicitly.
-        plt.sca(ax)
+        # All plot calls are passed `ax` explicitly: no need to make it the
+        # current axes.
         p.plot_mpl_subplot(ax)
 
-    # Align the subplots a little nicer, make more use of space. `hspace`: The
-    # amount of height reserved for space between subplots, expressed as a
-    # fraction of the average axis height
-    plt.xlabel("build date", fontsize=10)
+    # Label the shared x axis once, below the bottom subplot.
+    new_axs[-1].set_xlabel("build date", fontsize=10)
 
     # Add title and subtitle to figure.
     fig.text(
@@ -145,17 +203,21 @@ def create_summary_fig_with_subplots():
     #     color="gray",
     # )
 
-    plt.subplots_adjust(hspace=0.08, left=0.05, right=0.97, bottom=0.1, top=0.96)
-    plot.savefig(plt.gcf(), "multiplot summary")
+    # Align the subplots a little nicer, make more use of space. `hspace`: The
+    # amount of height reserved for space between subplots, expressed as a
+    # fraction of the average axis height
+    fig.subplots_adjust(hspace=0.08, left=0.05, right=0.97, bottom=0.1, top=0.96)
+    plot.savefig(fig, "multiplot summary")
+    plt.close(fig)
     # plt.show()
 
 
-def set_common_x_limit_for_plotting(builds):
-    # Get earliest and latest build.  Rely on result df of this func to be
-    # sorted by time: past -> future
-    df = construct_df_for_builds(builds)
+def set_common_x_limit_for_plotting(df):
+    # Get earliest and latest build. Rely on `df` (as returned by
+    # `construct_df_for_builds()`) to be sorted by time: past -> future
 
-    log.info('common_x_limit_for_plotting -- df:\n%s', df)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("common_x_limit_for_plotting -- df:\n%s", df)
     log.info("common_x_limit_for_plotting -- df.index[0]: %s", df.index[0])
     log.info("common_x_limit_for_plotting -- df.index[-1]: %s", df.index[-1])
 
@@ -169,15 +231,12 @@ def set_common_x_limit_for_plotting(builds):
     )
 
 
-def analyze_build_stability(builds_all, builds_passed, window_width_days):
+def analyze_build_stability(df_all, df_passed, window_width_days):
     log.info(
         "\n\nperform build stability analysis (from all builds, passed builds) -- window_width_days: %s",
         window_width_days,
     )
 
-    df_all = construct_df_for_builds(builds_all)
-    df_passed = construct_df_for_builds(builds_passed)
-
     df_passed_timestamp_series = df_passed.index.to_series()
     df_all_timestamp_series = df_all.index.to_series()
 
@@ -187,7 +246,9 @@ def analyze_build_stability(builds_all, builds_passed, window_width_days):
     log.info("timestamp of last build: %s", df_all_timestamp_series.index.max())
 
     rolling_build_rate_all = analysis.calc_rolling_event_rate(
-        df_all_timestamp_series, window_width_seconds=86400 * window_width_days
+        df_all_timestamp_series,
+        window_width_seconds=86400 * window_width_days,
+        cache=True,
     )
 
     # Passed builds: fill gaps with 0 (upsample), so that the following
@@ -205,6 +266,7 @@ def analyze_build_stability(builds_all, builds_passed, window_width_days):
         window_width_seconds=86400 * window_width_days,
         upsample_with_zeros=True,
         upsample_with_zeros_until=df_passed_timestamp_series.index.max(),
+        cache=True,
     )
 
     rolling_window_stability = rolling_build_rate_passed / rolling_build_rate_all
@@ -213,27 +275,26 @@ def analyze_build_stability(builds_all, builds_passed, window_width_days):
         window_width_days=window_width_days,
         context_descr=f"{CFG().args.org}/{CFG().args.pipeline}",
     )
-
-    p.plot_mpl_singlefig()
     _PLOTS_FOR_SUBPLOTS.append(p)
 
 
-def analyze_passed_builds(builds_all):
+def analyze_passed_builds(builds, df):
+    """
+    `builds`: passed builds (duration filter applied), `df`: the corresponding
+    DataFrame as returned by `construct_df_for_builds(builds)`.
+    """
     log.info("analyze passed builds")
 
-    builds = bfilter.filter_builds_passed(
-        bfilter.filter_builds_based_on_duration(builds_all)
-    )
-
     log.info("identify the set of step keys observed across builds")
     step_key_counter, jobs_by_key = identify_top_n_step_keys(builds, 7)
 
-    df = construct_df_for_builds(builds)
+    # Used in the context description of each plot below.
+    pipeline_descr = f"{CFG().args.org}/{CFG().args.pipeline}"
 
     # Duration plot for the entire pipeline
     p = plot.PlotDuration(
         df=df,
-        context_descr=f"{CFG().args.org}/{CFG().args.pipeline} (passed)",
+        context_descr=f"{pipeline_descr} (passed)",
         metricname="duration_seconds",
         rollingwindow_w_days=10,
         ylabel="pipeline duration (hours)",
@@ -241,7 +302,6 @@ def analyze_passed_builds(builds_all):
         title="pipeline",
         convert_to_hours=True,
     )
-    p.plot_mpl_singlefig()
     _PLOTS_FOR_SUBPLOTS.append(p)
 
     # Analysis and plots for top N build steps.
@@ -268,10 +328,11 @@ def analyze_passed_builds(builds_all):
         # Analysis and plots for a specific job key
         log.info("generate dataframe from list of jobs for step: %s", step_key)
         df_job = construct_df_for_jobs(jobs_by_key[step_key])
-        print(df_job)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("dataframe for step %s:\n%s", step_key, df_job)
         p = plot.PlotDuration(
             df_job,
-            context_descr=f"{CFG().args.org}/{CFG().args.pipeline}/{step_key} (passed)",
+            context_descr=f"{pipeline_descr}/{step_key} (passed)",
             metricname="duration_seconds",
             rollingwindow_w_days=10,
             ylabel="job duration (hours)",
@@ -279,147 +340,209 @@ def analyze_passed_builds(builds_all):
             title=step_key,
             convert_to_hours=True,
         )
-        p.plot_mpl_singlefig()
         _PLOTS_FOR_SUBPLOTS.append(p)
 
 
-def construct_df_for_jobs(jobs):
+def _plot_mpl_singlefig(p):
+    p.plot_mpl_singlefig()
 
-    log.info("build pandas dataframe for passed jobs")
 
-    # Drop those jobs that do not have an numeric duration (applies to jobs)
-    # that never started.
-    jobs = [j for j in jobs if j["duration_seconds"] is not None]
+def _init_singlefig_worker(plot_state, log_level, log_formatter):
+    # Worker processes started with the "spawn" method do not inherit the
+    # state of this process: set up logging and what plotting depends on.
+    handler = logging.StreamHandler()
+    handler.setFormatter(log_formatter)
+    logging.getLogger().addHandler(handler)
+    logging.getLogger().setLevel(log_level)
+    plot.set_state(plot_state)
+
+
+def plot_mpl_singlefigs(plots):
+    """
+    Render and save the individual figures for `plots`. These are independent
+    of each other: render them in parallel, in worker processes (pyplot is not
+    thread-safe).
+
+    On Linux, use the "fork" start method so that workers inherit
+    configuration (`CFG()`, matplotlib rcParams, ...). Elsewhere, forking a
+    process that has loaded matplotlib, numpy and a threaded HTTP client is
+    not safe (that is why CPython uses "spawn" by default on macOS): use
+    "spawn", and pass the configuration to each worker.
+    """
+    if len(plots) < 2 or CFG().args.multi_plot_only:
+        # With --multi-plot-only, `plot_mpl_singlefig()` only logs.
+        for p in plots:
+            p.plot_mpl_singlefig()
+        return
+
+    if sys.platform == "linux":
+        mp_context = multiprocessing.get_context("fork")
+        initializer, initargs = None, ()
+    else:
+        mp_context = multiprocessing.get_context("spawn")
+        root_logger = logging.getLogger()
+        initializer = _init_singlefig_worker
+        initargs = (
+            plot.get_state(),
+            root_logger.level,
+            root_logger.handlers[0].formatter if root_logger.handlers else None,
+        )
 
-    df_dict = {
-        "started_at": [j["started_at"] for j in jobs],
-        "build_number": [j["build_number"] for j in jobs],
-        # May be `None` -> `NaN` for failed jobs
-        "duration_seconds": [j["duration_seconds"] for j in jobs],
-    }
+    log.info(
+        "render %s figures in worker processes (%s)",
+        len(plots),
+        mp_context.get_start_method(),
+    )
+    with ProcessPoolExecutor(
+        max_workers=min(len(plots), os.cpu_count() or 1),
+        mp_context=mp_context,
+        initializer=initializer,
+        initargs=initargs,
+    ) as executor:
+        # Consume results, to propagate exceptions.
+        list(executor.map(_plot_mpl_singlefig, plots))
 
-    df = pd.DataFrame(df_dict, index=[pd.Timestamp(j["started_at"]) for j in jobs])
-    # Sort by time, from past to future.
-    log.info("df: sort by time")
-    df.sort_index(inplace=True)
 
-    # Remove sub-second resolution from index. Goal: all indices of all
-    # dataframes must have 1s resolution, towards being able to share
-    # x axis. Also see https://github.com/pandas-dev/pandas/issues/15874.
-    df.index = df.index.round("S")
+def construct_df_for_jobs(jobs):
 
-    return df
+    log.info("build pandas dataframe for passed jobs")
+
+    # Drop those jobs that do not have an numeric duration (applies to jobs
+    # that never started).
+    return _construct_df(
+        [j for j in jobs if j["duration_seconds"] is not None],
+        number_key="build_number",
+    )
 
 
 def construct_df_for_builds(builds, jobs=False, ignore_builds=None):
 
     log.info("build pandas dataframe for builds")
 
-    df_dict = {
-        "started_at": [b["started_at"] for b in builds],
-        "build_number": [b["number"] for b in builds],
-        # May be `None` -> `NaN` for failed builds
-        "duration_seconds": [b["duration_seconds"] for b in builds],
-    }
+    # `duration_seconds` may be `None` -> `NaN` for failed builds.
+    return _construct_df(builds, number_key="number")
+
+
+def _construct_df(objs, number_key):
+    """
+    Construct a DataFrame with the columns `started_at`, `build_number` and
+    `duration_seconds` from build or job objects (`objs`, a list). The
+    build number is read from the `number_key` property.
+
+    The index is the start time with 1 s resolution, sorted from past to
+    future.
+    """
+    n = len(objs)
+    started_at = pd.DatetimeIndex([o["started_at"] for o in objs])
+    # Extract the numeric columns directly into typed buffers of known size
+    # (no intermediate list of Python objects to convert). Narrower dtypes:
+    # build numbers fit into int32, and float32 represents durations of up to
+    # days with sub-second precision.
+    build_numbers = np.fromiter((o[number_key] for o in objs), dtype=np.int32, count=n)
+    durations = np.fromiter(
+        (
+            np.nan if o["duration_seconds"] is None else o["duration_seconds"]
+            for o in objs
+        ),
+        dtype=np.float32,
+        count=n,
+    )
 
-    df = pd.DataFrame(df_dict, index=[pd.Timestamp(b["started_at"]) for b in builds])
+    # Sort by time, from past to future (if not already sorted). Do that on
+    # the column arrays, via the sort order of the int64 timestamps, before
+    # constructing the DataFrame.
+    if not started_at.is_monotonic_increasing:
+        log.info("df: sort by time")
+        order = np.argsort(started_at.asi8, kind="stable")
+        started_at = started_at[order]
+        build_numbers = build_numbers[order]
+        durations = durations[order]
+
+    df = pd.DataFrame(
+        {
+            "started_at": started_at.array,
+            "build_number": build_numbers,
+            "duration_seconds": durations,
+        },
+        index=started_at,
+    )
 
-    # Sort by time, from past to future.
-    log.info("df: sort by time")
-    df.sort_index(inplace=True)
     # Remove sub-second resolution from index. Goal: all indices of all
     # dataframes must have 1s resolution, towards being able to share
     # x axis. Also see https://github.com/pandas-dev/pandas/issues/15874.
-    df.index = df.index.round("S")
+    df.index = df.index.round("s")
     return df
 
 
 def rewrite_build_objects(builds):
     log.info("process %s builds, rewrite meta data", len(builds))
 
-    # log.info("rewrite timestamp strings into datetime objects")
-    # Use `fromisoformat()`, introduced in stdlib in 3.7:
-    #
-    # >>> from datetime import datetime
-    # >>> ts = datetime.fromisoformat("2020-11-22T12:01:15.000")
-    # >>> ts
-    # datetime.datetime(2020, 11, 22, 12, 1, 15)
-    # >>> ts = datetime.fromisoformat("2020-11-22T12:01:15.000Z".replace('Z', '+00:00'))
-    # >>> ts
-    # datetime.datetime(2020, 11, 22, 12, 1, 15, tzinfo=datetime.timezone.utc)
-
     # Enrich each build object with meta data used later.
-    for b in builds:
-
-        for dtprop in ("created_at", "started_at", "scheduled_at", "finished_at"):
-            try:
-                b[dtprop] = datetime.fromisoformat(b[dtprop].replace("Z", "+00:00"))
-            except AttributeError:
-                # `started_at` may be null/None: build did not start (no free
-                # agent?) -> 'NoneType' object has no attribute 'replace'
-                continue
-        try:
-            b["duration_seconds"] = (b["finished_at"] - b["started_at"]).total_seconds()
-        except TypeError:
-            # unsupported operand type(s) for -: 'NoneType' and 'NoneType'
-            b["duration_seconds"] = None
-
-        for j in b["jobs"]:
-            # may want to be able to associate a job with a build again later
-            # on. shortcut for now, can extract build number from build_url
-            # later.
-            if j["type"] == "waiter":
-                # don't process these here, they look like this:
-                # {'id': 'bf10920b-b826-4ba5-9d77-fd58bd24a2dc', 'type': 'waiter'}
-                continue
+    rewrite_timestamps(builds)
 
-            j["build_number"] = 1
+    # May want to be able to associate a job with a build again later on.
+    # Shortcut for now, can extract build number from build_url later.
+    # Don't process "waiter" jobs here, they look like this:
+    # {'id': 'bf10920b-b826-4ba5-9d77-fd58bd24a2dc', 'type': 'waiter'}
+    jobs = [j for b in builds for j in b["jobs"] if j["type"] != "waiter"]
+    for j in jobs:
+        j["build_number"] = 1
 
-            for dtprop in ("created_at", "started_at", "scheduled_at", "finished_at"):
-
-                try:
-                    j[dtprop] = datetime.fromisoformat(j[dtprop].replace("Z", "+00:00"))
-                except AttributeError:
-                    # `started_at` may be null/None: job did not start
-                    # -> 'NoneType' object has no attribute 'replace'
-                    continue
-
-            try:
-                j["duration_seconds"] = (
-                    j["finished_at"] - j["started_at"]
-                ).total_seconds()
-            except TypeError:
-                # unsupported operand type(s) for -: 'NoneType' and 'NoneType'
-                j["duration_seconds"] = None
+    rewrite_timestamps(jobs)
 
     log.info("done re-writing builds")
     return builds
 
 
+def rewrite_timestamps(objs):
+    """
+    Rewrite timestamp strings of build or job objects into datetime objects
+    (in-place), and add the `duration_seconds` property.
+
+    Parse all values of a timestamp property in one go with
+    `pd.to_datetime()` (C parser) instead of calling `fromisoformat()` for
+    each object. `format="ISO8601"`: do not infer the format from the first
+    value; the number of fractional second digits may vary between values.
+    `started_at` may be null/None: build/job did not start (no free
+    agent?). These become `NaT` during parsing, and are written back as
+    `None`.
+    """
+    parsed = {}
+    for dtprop in ("created_at", "started_at", "scheduled_at", "finished_at"):
+        dtidx = pd.to_datetime([o[dtprop] for o in objs], utc=True, format="ISO8601")
+        values = np.where(dtidx.isna(), None, dtidx.to_pydatetime())
+        for o, v in zip(objs, values):
+            o[dtprop] = v
+        parsed[dtprop] = dtidx
+
+    # `NaT` propagates through the subtraction -> `NaN` -> `None`.
+    durations = (parsed["finished_at"] - parsed["started_at"]).total_seconds()
+    for o, d in zip(objs, np.where(np.isnan(durations), None, durations)):
+        o["duration_seconds"] = d
+
+
 def identify_top_n_step_keys(builds, top_n):
     # Build up a dictionary while iterating of over all jobs. The keys in that
     # dict are the job keys. For each job key, construct a list of
     # corresponding jobs (no sorting order guarantees).
+    # Also build the histogram (which step (key) was executed how often?) in
+    # the same pass.
     jobs_by_key = defaultdict(list)
+    step_key_counter = Counter()
 
-    step_keys = []
     for b in builds:
         for job in b["jobs"]:
-            if not "step_key" in job:
-                # for example:
-                # {'id': 'e05fce02-c89b-4326-8181-e7b54333e202', 'type': 'waiter'}
+            # Look up the step key once. It is not set for example for
+            # {'id': 'e05fce02-c89b-4326-8181-e7b54333e202', 'type': 'waiter'}
+            # and `None` for example for the pipeline initiation step:
+            #  "name": ":pipeline:",
+            #  "step_key": null,
+            step_key = job.get("step_key")
+            if step_key is None:
                 continue
-            if job["step_key"] is None:
-                # for example, the pipeline initiation step:
-                #  "name": ":pipeline:",
-                #  "step_key": null,
-                continue
-            jobs_by_key[job["step_key"]].append(job)
-            step_keys.append(str(job["step_key"]))
-    log.info("set of step keys across passed builds: %s", set(step_keys))
-
-    log.info("build histogram: which step (key) was executed how often?")
-    step_key_counter = Counter([k for k in step_keys])
+            jobs_by_key[step_key].append(job)
+            step_key_counter[step_key] += 1
+    log.info("set of step keys across passed builds: %s", set(step_key_counter))
 
     log.info("top %s executed build steps (by step key)", top_n)
     tabletext = utils.get_mdtable(
@@ -431,17 +554,114 @@ def identify_top_n_step_keys(builds, top_n):
     return step_key_counter, jobs_by_key
 
 
-def fetch_builds(orgslug, pipelineslug, states, only_newer_than_build_number=-1):
+def strip_build_object(b):
+    """
+    Return a copy of the build object `b` (as returned by the Buildkite API)
+    with only those properties (of the build and of its jobs) that are used
+    for analysis. This reduces memory usage and the size of the pickle cache
+    file, and speeds up (de)serialization of the latter.
+
+    Note that "waiter" jobs do not have most of the job properties, e.g.
+    {'id': 'bf10920b-b826-4ba5-9d77-fd58bd24a2dc', 'type': 'waiter'}
+    """
+    stripped = {k: b[k] for k in _BUILD_PROPS if k in b}
+    stripped["jobs"] = [
+        {k: j[k] for k in _JOB_PROPS if k in j} for j in b.get("jobs", [])
+    ]
+    return stripped
+
+
+def _is_stripped(b):
+    # Cheap check (no copy): does `b` have only the properties kept by
+    # `strip_build_object()`?
+    return set(b).issubset(_BUILD_PROPS) and all(
+        set(j).issubset(_JOB_PROPS) for j in b.get("jobs", [])
+    )
+
+
+def fetch_builds(
+    orgslug,
+    pipelineslug,
+    states,
+    only_newer_than_build_number=-1,
+    created_from=None,
+):
+    """
+    `created_from`: if set (a `datetime` object), ask Buildkite to only return
+    builds created at or after that point in time (filter server-side). This
+    does not replace the `only_newer_than_build_number` check.
+    """
 
     builds = []
 
-    def _process_response_page(builds_resp):
+    def _get_page(page):
+        return bk_client().builds().list_all_for_pipeline(
+            orgslug,
+            pipelineslug,
+            page=page,
+            created_from=created_from,
+            states=states,
+            with_pagination=True,
+        )
+
+    def _pages():
+        """
+        Yield the (already deserialized) body of one paginated response at a
+        time, from newest to oldest builds.
+
+        The first response reveals the number of the last page. Fetching is
+        network latency-bound, so the remaining pages are then requested
+        concurrently, with at most `_FETCH_CONCURRENCY` requests in flight
+        (sliding window, in page order). When the consumer stops iterating,
+        requests not yet started are cancelled.
+        """
+        builds_resp = _get_page(0)
+        yield builds_resp.body
+
+        if not builds_resp.next_page:
+            log.info("first page says there is no next page")
+            return
+
+        first_page, last_page = builds_resp.next_page, builds_resp.last_page
+        if not last_page:
+            # Total not known: walk the remaining pages one after another.
+            while builds_resp.next_page:
+                log.info("builds_resp.next_page: %s", builds_resp.next_page)
+                builds_resp = _get_page(builds_resp.next_page)
+                yield builds_resp.body
+            return
+
+        log.info("fetch pages %s to %s", first_page, last_page)
+
+        with ThreadPoolExecutor(max_workers=_FETCH_CONCURRENCY) as executor:
+            futures = {}
+
+            def _submit(page):
+                if page <= last_page:
+                    futures[page] = executor.submit(_get_page, page)
+
+            try:
+                for page in range(first_page, first_page + _FETCH_CONCURRENCY):
+                    _submit(page)
+
+                for page in range(first_page, last_page + 1):
+                    builds_resp = futures.pop(page).result()
+                    _submit(page + _FETCH_CONCURRENCY)
+                    log.info("got page %s of %s", page, last_page)
+                    yield builds_resp.body
+            finally:
+                # Consumer is done (or an error occurred): do not wait for
+                # requests that are not needed anymore.
+                for f in futures.values():
+                    f.cancel()
+
+    def _process_response_page(builds_cur_page):
         """
         Process response. Populate the `builds` list.
 
         Notes:
 
-        - `builds_resp.body` is already deserialized, interestingly (not a
+        - The response body is already deserialized, interestingly (not a
           body, i.e. not str or bytes).
 
         -  Rely on sort order as of API docs: "Builds are listed in the order
@@ -449,54 +669,55 @@ def fetch_builds(orgslug, pipelineslug, states, only_newer_than_build_number=-1)
            newer to older. Stop iteration when observing the first build that
            is "too old".
         """
-
-        builds_cur_page = builds_resp.body
-        log.info(f"got {len(builds_cur_page)} builds in paginated response")
-
+        log.info("got %s builds in paginated response", len(builds_cur_page))
+
+        # Adding this because I realized that despite having filtered
+        # by pipeline there were other builds in the responses, specifically
+        # ``"slug": "prs"``. Drop those: their build numbers are unrelated to
+        # the numbers of this pipeline's builds (and would break the sort
+        # order relied upon below).
+        page = []
+        unexpected_slugs = set()
         for b in builds_cur_page:
-            # Adding this because I realized that despite having filtered
-            # by pipeline there were other builds in the responses, specifically
-            # ``"slug": "prs"``
-            if b["pipeline"]["slug"] != pipelineslug:
-                log.error(
-                    "got unexpected build in response, with pipeline slug %s",
-                    b["pipeline"]["slug"],
-                )
-            if b["number"] > only_newer_than_build_number:
-                builds.append(b)
+            slug = b["pipeline"]["slug"]
+            if slug == pipelineslug:
+                page.append(b)
             else:
-                log.info(
-                    "current page contains build %s and older -- drop, stop fetching",
-                    b["number"],
-                )
-                # Signal to caller that no more pages should be fetched.
-                return False
+                unexpected_slugs.add(slug)
+
+        if unexpected_slugs:
+            log.error(
+                "got %s unexpected build(s) in response, with pipeline slug(s) %s -- drop",
+                len(builds_cur_page) - len(page),
+                ", ".join(sorted(unexpected_slugs)),
+            )
+
+        # Build numbers are sorted in descending order: find the position of
+        # the first build that is not newer than the cutoff via binary search
+        # (on the negated, i.e. ascending, numbers).
+        numbers = np.fromiter(
+            (b["number"] for b in page), dtype=np.int64, count=len(page)
+        )
+        cut = int(
+            np.searchsorted(-numbers, -only_newer_than_build_number, side="left")
+        )
+        builds.extend(strip_build_object(b) for b in page[:cut])
+
+        if cut < len(page):
+            log.info(
+                "current page contains build %s and older -- drop, stop fetching",
+                page[cut]["number"],
+            )
+            # Signal to caller that no more pages should be fetched.
+            return False
 
         log.info('current page returned only "new builds", keep fetching')
         return True
 
     log.info("fetch builds: get first page (newest builds first)")
-
-    builds_resp = BK_CLIENT.builds().list_all_for_pipeline(
-        orgslug,
-        pipelineslug,
-        states=states,
-        with_pagination=True,
-    )
-    continue_fetching = _process_response_page(builds_resp)
-
-    while continue_fetching and builds_resp.next_page:
-        log.info("builds_resp.next_page: %s", builds_resp.next_page)
-        builds_resp = BK_CLIENT.builds().list_all_for_pipeline(
-            orgslug,
-            pipelineslug,
-            page=builds_resp.next_page,
-            states=states,
-            with_pagination=True,
-        )
-        continue_fetching = _process_response_page(builds_resp)
-        if not builds_resp.next_page:
-            log.info("last page says there is no next page")
+    for builds_cur_page in _pages():
+        if not _process_response_page(builds_cur_page):
+            break
 
     log.info("fetched data for %s finished builds", len(builds))
 
@@ -514,23 +735,37 @@ def fetch_builds(orgslug, pipelineslug, states, only_newer_than_build_number=-1)
 
 def load_all_builds(orgslug, pipelineslug, states):
 
-    cache_filepath = f"{CFG().args.org}_{CFG().args.pipeline}.pickle.cache"
-    builds_cached = utils.load_pickle_file_if_exists(cache_filepath)
+    cache_filepath = f"{orgslug}_{pipelineslug}.pickle.cache"
+    # The cache file is a sequence of pickle frames, each holding a list of
+    # builds (from older to newer): one frame from the initial fetch, and one
+    # per forward-fill. That way, a forward-fill does not need to re-serialize
+    # the (large) set of previously cached builds.
+    frames = utils.load_pickle_frames_if_exists(cache_filepath)
 
-    if builds_cached is None:
+    if frames is None:
         log.info("no cache found, fetch all builds")
         builds = fetch_builds(orgslug, pipelineslug, states)
         log.info("persist to disk (pickle cache) -- all builds were fetched freshly")
         utils.write_pickle_file(builds, cache_filepath)
         return builds
 
+    builds_cached = [b for frame in frames for b in frame]
     log.info("loaded %s builds from disk", len(builds_cached))
 
+    # Get the cache age before (potentially) re-writing the cache below.
+    cache_age_minutes = (time.time() - os.stat(cache_filepath).st_mtime) / 60.0
+
+    # The cache might have been written before build objects were stripped
+    # down upon fetch. In that case, strip them and re-write the cache (once).
+    if not all(_is_stripped(b) for b in builds_cached):
+        log.info("strip cached build objects, re-write cache")
+        builds_cached = [strip_build_object(b) for b in builds_cached]
+        utils.write_pickle_file(builds_cached, cache_filepath)
+
     # tmp: use current cache state, interesting data state
     # return builds_cached
 
     skip_if_newer_than_mins = 60
-    cache_age_minutes = (time.time() - os.stat(cache_filepath).st_mtime) / 60.0
     if cache_age_minutes < skip_if_newer_than_mins:
         log.info("skip remote fetch: cache written %.1f minutes ago", cache_age_minutes)
         return builds_cached
@@ -544,18 +779,32 @@ def load_all_builds(orgslug, pipelineslug, states):
 
     log.info("newest build number in cache: %s", newest_build_in_cache["number"])
     log.info("update (forward-fill)")
+
+    # Only fetch builds created at or after the newest build in the cache: this
+    # makes the Buildkite API skip all older builds, typically collapsing the
+    # update into a single page. Use a naive datetime (UTC) because pybuildkite
+    # does not URL-encode the "+" of a "+00:00" UTC offset.
+    created_from = (
+        pd.Timestamp(newest_build_in_cache["created_at"])
+        .tz_convert(None)
+        .to_pydatetime()
+    )
+    log.info("forward-fill: only fetch builds created from %s (UTC)", created_from)
     new_builds = fetch_builds(
         orgslug,
         pipelineslug,
         states,
         only_newer_than_build_number=newest_build_in_cache["number"],
+        created_from=created_from,
     )
 
-    log.info(
-        "persist to disk (pickle cache): combination of previous cache and newly fetched builds"
-    )
+    if new_builds:
+        log.info("persist to disk (pickle cache): append newly fetched builds")
+        utils.append_pickle_file(new_builds, cache_filepath)
+    else:
+        # Mark cache as up-to-date (see `skip_if_newer_than_mins`).
+        os.utime(cache_filepath)
+
     builds = builds_cached
     builds.extend(new_builds)
-    utils.write_pickle_file(builds, cache_filepath)
-
-    return builds
\ No newline at end of file
+    return builds
@@ -57,6 +57,13 @@ def parse_args():
     )
 
     parser.add_argument("--output-directory", default=TODAY + "_report")
+    parser.add_argument(
+        "--figure-dpi",
+        type=int,
+        default=150,
+        help="Resolution of the PNG figure files (dots per inch). Lower values "
+        + "make rendering faster, e.g. for drafts (default: 150)",
+    )
     # parser.add_argument("--resources-directory", default="resources")
     # parser.add_argument("--pandoc-command", default="pandoc")
 
@@ -86,6 +93,14 @@ def parse_args():
         metavar="YYYY-MM-DD",
     )
 
+    parser_bk.add_argument(
+        "--mode",
+        choices=("all", "rate", "jobs"),
+        default="all",
+        help="Analyses to perform: build rate and stability ('rate'), "
+        + "pipeline and job durations ('jobs'), or both (default)",
+    )
+
     parser_bk.add_argument(
         "--multi-plot-only",
         action="store_true",
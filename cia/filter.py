@@ -44,9 +44,10 @@ def drop_builds_that_did_not_start_or_finish(builds):
 
 def filter_builds_based_on_build_time(builds):
     builds_kept = builds
-    if CFG().args.ignore_builds_before:
+    ignore_builds_before = CFG().args.ignore_builds_before
+    if ignore_builds_before:
         # tz-naive
-        earliest_date = datetime.strptime(CFG().args.ignore_builds_before, "%Y-%m-%d")
+        earliest_date = datetime.strptime(ignore_builds_before, "%Y-%m-%d")
         # turn into tz-aware, otherwise can't compare offset-naive and
         # offset-aware datetimes.
         earliest_date = earliest_date.replace(tzinfo=timezone.utc)
@@ -59,37 +60,28 @@ def filter_builds_based_on_build_time(builds):
     return builds_kept
 
 
-def filter_builds_based_on_duration(builds):
-    builds_kept = builds
-
-    if CFG().args.ignore_builds_shorter_than:
-
-        log.info("filter builds: ignore_builds_shorter_than")
-        builds_kept = [
-            b
-            for b in builds
-            if b["duration_seconds"] >= CFG().args.ignore_builds_shorter_than
-        ]
-        log.info("survived filter: %s", len(builds_kept))
-        log.info("dropped by filter: %s", len(builds) - len(builds_kept))
-
-    if CFG().args.ignore_builds_longer_than:
-        builds = builds_kept
-        log.info("filter builds: ignore_builds_longer_than")
-        builds_kept = [
-            b
-            for b in builds
-            if b["duration_seconds"] <= CFG().args.ignore_builds_longer_than
-        ]
-        log.info("survived filter: %s", len(builds_kept))
-        log.info("dropped by filter: %s", len(builds) - len(builds_kept))
-
-    return builds_kept
-
-
-def filter_builds_passed(builds):
-    log.info("filter builds: passed (keep)")
-    builds_kept = [b for b in builds if b["state"] == "passed"]
+def filter_builds_passed_based_on_duration(builds):
+    """
+    Keep builds that passed and whose duration is within the (optional)
+    bounds set via --ignore-builds-shorter-than/--ignore-builds-longer-than.
+    Evaluate both predicates in a single pass over `builds`.
+    """
+    shorter_than = CFG().args.ignore_builds_shorter_than
+    longer_than = CFG().args.ignore_builds_longer_than
+    # A bound that is not set does not filter anything.
+    lower = shorter_than or float("-inf")
+    upper = longer_than or float("inf")
+    log.info(
+        "filter builds: passed (keep), ignore_builds_shorter_than: %s, "
+        + "ignore_builds_longer_than: %s",
+        shorter_than,
+        longer_than,
+    )
+    builds_kept = [
+        b
+        for b in builds
+        if b["state"] == "passed" and lower <= b["duration_seconds"] <= upper
+    ]
     log.info("survived filter: %s", len(builds_kept))
     log.info("dropped by filter: %s", len(builds) - len(builds_kept))
     return builds_kept
@@ -24,14 +24,13 @@
 import logging
 import os
 import re
-import pickle
 from abc import ABC, abstractmethod
 
 import matplotlib
 import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
 
-from .cfg import CFG, TODAY, FIGURE_FILE_PATHS
+from .cfg import CFG, TODAY
 
 
 import cia.analysis as analysis
@@ -43,6 +42,15 @@ _Y_LABEL_FONTSIZE = 7
 _CONTEXT_LABEL_FONTSIZE = 6
 _CONTEXT_LABEL_FONTCOLOR = "#444444"
 
+# Characters not allowed in figure file names (see
+# `savefig()`).
+_TITLE_SPECIAL_CHARS_RE = re.compile("[^a-z0-9]+")
+
+# Options for encoding PNG files (passed to Pillow). The default zlib
+# compression level (6) spends much more time than level 3 for a small
+# reduction of the file size of these (mostly flat-colored) figures.
+_PNG_PIL_KWARGS = {"compress_level": 3, "optimize": False}
+
 class Plot(ABC):
 
     _savefig_title = "override"
@@ -57,19 +65,19 @@ class Plot(ABC):
 
         log.info("create singlefig plot: %s", self.__class__.__name__)
 
-        # Create a new figure.
-        fig = plt.figure()
-        ax = plt.gca()
+        # Create a new figure. Close it after writing it to disk: pyplot keeps
+        # a reference to each figure otherwise (memory is not freed). Let
+        # constrained layout (computed as part of drawing) make room for the
+        # axis labels, instead of running the tight_layout() solver upfront.
+        fig, ax = plt.subplots(constrained_layout=True)
         self._plot_mpl_core(ax)
 
-        plt.tight_layout(rect=(0, 0, 1, 0.95))
-        # fig.close()
         figure_filepath = self._savefig_mpl(fig, self._savefig_title)
+        plt.close(fig)
         return fig, figure_filepath
 
     def plot_mpl_subplot(self, ax):
         log.debug("plot_mpl_subplot: ax: %s (%s)", ax, id(ax))
-        # plt.sca(ax)
         self._plot_mpl_core(ax)
         return ax
 
@@ -95,7 +103,7 @@ class PlotStability(Plot):
             # marker=".",
             markersize=0.8,
             markeredgecolor="gray",
-            # ax=ax,
+            ax=ax,
         )
 
         legendlist.append(f"rolling window mean ({self.wwd} days)")
@@ -126,36 +134,49 @@ class PlotBuildrate(Plot):
         self.context_descr = context_descr
         self._savefig_title = f"build rate {context_descr}"
 
-    def _plot_mpl_core(self, ax):
-        legendlist = []
+        # The same plot is typically drawn more than once (single figure,
+        # subplot in summary figure). Calculate the build rates once, here.
+        self._rolling_build_rates = self._prepare_data()
 
+    def _prepare_data(self):
         log.info(
-            "\n\nPlotBuildrate._plot_mpl_core() for %s", list(self.builds_map.keys())
+            "\n\nPlotBuildrate._prepare_data() for %s", list(self.builds_map.keys())
         )
+        window_width_seconds = 86400 * self.wwd
+        rolling_build_rates = {}
         for descr, df in self.builds_map.items():
             log.info("analyze build rate: %s", descr)
             # Analysis and plots for entire pipeline, for passed builds.
             # follow https://github.com/jgehrcke/bouncer-log-analysis/blob/master/bouncer-log-analysis.py#L514
             # use rw of fixed (time) width (expose via cli arg) and set min number of
             # samples (expose via cli arg).
-            legendlist.append(f"{descr}, rolling window mean ({self.wwd} days)")
 
             # special-case: rely on "all builds" key to exist; treat that
             # time series differently from all others: assume that all others
             # are, each, a subset of all builds.
             if descr == "all builds":
                 log.info("\n\ncalc_rolling_event_rate() for all builds")
-                rolling_build_rate = analysis.calc_rolling_event_rate(
-                    df.index.to_series(), window_width_seconds=86400 * self.wwd
+                rolling_build_rates[descr] = analysis.calc_rolling_event_rate(
+                    df.index.to_series(),
+                    window_width_seconds=window_width_seconds,
+                    cache=True,
                 )
             else:
                 log.info("\n\ncalc_rolling_event_rate() for subset of all builds")
-                rolling_build_rate = analysis.calc_rolling_event_rate(
+                rolling_build_rates[descr] = analysis.calc_rolling_event_rate(
                     df.index.to_series(),
-                    window_width_seconds=86400 * self.wwd,
+                    window_width_seconds=window_width_seconds,
                     upsample_with_zeros=True,
                     upsample_with_zeros_until=self.builds_map["all builds"].index.max(),
+                    cache=True,
                 )
+        return rolling_build_rates
+
+    def _plot_mpl_core(self, ax):
+        legendlist = []
+
+        for descr, rolling_build_rate in self._rolling_build_rates.items():
+            legendlist.append(f"{descr}, rolling window mean ({self.wwd} days)")
 
             log.info("Plot build rate: window width (days): %s", self.wwd)
 
@@ -166,7 +187,7 @@ class PlotBuildrate(Plot):
                 # marker=".",
                 markersize=0.8,
                 markeredgecolor="gray",
-                # ax=ax,
+                ax=ax,
             )
 
         # log.info("symlog: set lower ylim to 0")
@@ -243,20 +264,30 @@ class PlotDuration(Plot):
             f"{context_descr} {title} {metricname} {self._linlog} {descr_suffix}"
         )
 
-    def _plot_mpl_core(self, ax):
-
-        log.info("_plot_mpl_core: ax: %s", id(ax))
+        # The same plot is typically drawn more than once (single figure,
+        # subplot in summary figure). Prepare the data to plot once, here.
+        self._series_to_plot, self._mean, self._median = self._prepare_data()
 
+    def _prepare_data(self):
         width_string = f"{self.wwd}d"
-        series_to_plot = self.df[self.metricname].copy()
+        # No need for a copy: `series_to_plot` is only read from below, and
+        # the unit conversion creates a new Series anyway.
+        series_to_plot = self.df[self.metricname]
 
         # Convert from unit [seconds] to [hours].
         if self.convert_to_hours:
             series_to_plot = series_to_plot / 3600.0
 
-        rollingwindow = series_to_plot.rolling(width_string)
-        mean = rollingwindow.mean()
-        median = rollingwindow.median()
+        # Aggregate the same rolling window object to both, mean and median,
+        # in one go.
+        rolling_stats = series_to_plot.rolling(width_string).agg(["mean", "median"])
+        return series_to_plot, rolling_stats["mean"], rolling_stats["median"]
+
+    def _plot_mpl_core(self, ax):
+
+        log.info("_plot_mpl_core: ax: %s", id(ax))
+
+        series_to_plot, mean, median = self._series_to_plot, self._mean, self._median
 
         # offset_seconds = - int(wwd * 24 * 60 * 60 / 2.0) + 1
         # median = median.shift(offset_seconds)
@@ -265,6 +296,7 @@ class PlotDuration(Plot):
 
         if self.show_median:
             median.plot(
+                ax=ax,
                 linestyle="solid",
                 dash_capstyle="round",
                 color="#666666",
@@ -274,7 +306,21 @@ class PlotDuration(Plot):
             legendlist.append(f"rolling window median ({self.wwd} days)")
 
         if self.show_raw:
-            series_to_plot.plot(
+            # A marker is several pixels wide: with many data points, most
+            # markers are drawn on top of each other. Only plot one data point
+            # per pixel. The axes' range is not smaller than the data range,
+            # and the axes are not larger than the figure: a grid over the
+            # data range with one cell per pixel of the figure (as saved) is
+            # not coarser than the pixel grid of the axes.
+            width_inch, height_inch = ax.figure.get_size_inches()
+            dpi = matplotlib.rcParams["savefig.dpi"]
+            analysis.downsample_to_pixel_grid(
+                series_to_plot,
+                width_px=int(width_inch * dpi),
+                height_px=int(height_inch * dpi),
+                ylog=self.ylog,
+            ).plot(
+                ax=ax,
                 # linestyle='dashdot',
                 linestyle="None",
                 color="gray",
@@ -283,11 +329,15 @@ class PlotDuration(Plot):
                 markeredgecolor="#aaaaaa",
                 zorder=1,  # Show in the back.
                 clip_on=True,
+                # Rasterize this (potentially large) marker layer at save time
+                # instead of keeping one vector path per marker.
+                rasterized=True,
             )
             legendlist.append("individual builds")
 
         if self.show_mean:
             mean.plot(
+                ax=ax,
                 linestyle="solid",
                 color="#e05f4e",
                 linewidth=1.3,
@@ -300,8 +350,10 @@ class PlotDuration(Plot):
             ax.set_xlim(_GLOBAL_X_LIMIT)
 
         # To put the duration into perspective: make sure to show the lower
-        # end, the zero, by default. Maybe do a common y max limit alter.
-        ax.set_ylim((-0.09, ax.get_ylim()[1] * 1.2))
+        # end, the zero, by default (not possible on a log scale). Maybe do a
+        # common y max limit alter.
+        if not self.ylog:
+            ax.set_ylim((-0.09, ax.get_ylim()[1] * 1.2))
 
         if self.xlabel is None:
             ax.set_xlabel("build start time", fontsize=10)
@@ -323,17 +375,15 @@ class PlotDuration(Plot):
         ax.legend(legendlist, numpoints=4, loc='upper left')
 
         if self.ylog:
-            # untested so far
-            self._mutate_cur_mpl_ax_to_logscale()
+            self._mutate_mpl_ax_to_logscale(ax)
 
         return median, ax
 
-    def _mutate_cur_mpl_ax_to_logscale(self):
-        log.info("mutate current ax to logscale")
-
-        ax = plt.gca()
-        median, ax = self._plot_mpl_core(ax)
-        plt.yscale("log")
+    def _mutate_mpl_ax_to_logscale(self, ax):
+        # Switch the scale of the already populated `ax` (no need to plot
+        # the data again).
+        log.info("mutate ax to logscale")
+        ax.set_yscale("log")
 
         # Set ytick labels using 0.01, 0.1, 1, 10, 100, instead of 10^0 etc.
         # Creds:
@@ -342,14 +392,17 @@ class PlotDuration(Plot):
         if self.yticks is not None:
             # ax.set_yticks([0.001, 0.01, 0.1, 0.5, 1, 3, 10])
             ax.set_yticks(self.yticks)
-        ax.yaxis.set_major_formatter(
-            ticker.FuncFormatter(lambda y, _: "{:g}".format(y))
-        )
+        ax.yaxis.set_major_formatter(ticker.FuncFormatter(_format_tick_g))
 
         # https://github.com/pandas-dev/pandas/issues/2010
         ax.set_xlim(ax.get_xlim()[0] - 1, ax.get_xlim()[1] + 1)
 
 
+def _format_tick_g(value, _pos):
+    # Tick label formatter for `ticker.FuncFormatter` (e.g. 0.1, 1, 10).
+    return format(value, "g")
+
+
 def set_x_limit_for_all_plots(lower, upper):
     global _GLOBAL_X_LIMIT
 
@@ -357,11 +410,27 @@ def set_x_limit_for_all_plots(lower, upper):
     _GLOBAL_X_LIMIT = (lower, upper)
 
 
-# def get_axes_in_new_fig():
-#     plt.figure()
-#     # Add an axes to the current figure and make it the current axes.
-#     ax = plt.axes()
-#     return ax
+def get_state():
+    """
+    Return the module-level state that plotting depends on (command line
+    arguments, matplotlib rcParams, common x limits, date in file names),
+    for `set_state()` in a worker process that does not inherit it.
+    """
+    return {
+        "args": CFG().args,
+        "rcparams": dict(matplotlib.rcParams),
+        "x_limit": _GLOBAL_X_LIMIT,
+        "today": TODAY,
+    }
+
+
+def set_state(state):
+    global _GLOBAL_X_LIMIT, TODAY
+
+    CFG().args = state["args"]
+    matplotlib.rcParams.update(state["rcparams"])
+    _GLOBAL_X_LIMIT = state["x_limit"]
+    TODAY = state["today"]
 
 
 def matplotlib_config():
@@ -371,7 +440,7 @@ def matplotlib_config():
     matplotlib.rcParams["legend.fontsize"] = 6
     matplotlib.rcParams["figure.figsize"] = [10.0, 4.2]
     matplotlib.rcParams["figure.dpi"] = 100
-    matplotlib.rcParams["savefig.dpi"] = 190
+    matplotlib.rcParams["savefig.dpi"] = CFG().args.figure_dpi
     # mpl.rcParams['font.size'] = 12
 
     original_color_cycle = matplotlib.rcParams["axes.prop_cycle"]
@@ -390,11 +459,11 @@ def savefig(fig, title):
     `fig`: explicitly pass in figure object. Can obtain with `gcf()`.
     """
     # Lowercase, replace special chars with whitespace, join on whitespace.
-    cleantitle = "-".join(re.sub("[^a-z0-9]+", " ", title.lower()).split())
+    cleantitle = "-".join(_TITLE_SPECIAL_CHARS_RE.sub(" ", title.lower()).split())
 
     fname = TODAY + "_" + cleantitle
 
     fpath_figure = os.path.join(CFG().args.output_directory, fname + ".png")
     log.info("Writing PNG figure to %s", fpath_figure)
-    fig.savefig(fpath_figure, dpi=150)
+    fig.savefig(fpath_figure, pil_kwargs=_PNG_PIL_KWARGS)
     return os.path.basename(fpath_figure)
\ No newline at end of file
@@ -23,51 +23,128 @@
 import os
 import logging
 import pickle
-from io import StringIO
-
-import pytablewriter
 
 log = logging.getLogger(__name__)
 
 
-def load_pickle_file_if_exists(path):
-    # Load from disk if already fetched today, otherwise return `None`.
-    if os.path.exists(path):
-        log.info("loading data from file: %s", path)
-        with open(path, "rb") as f:
-            data = f.read()
-        log.info("read %.2f MiB", len(data) / 1024.0 / 1024.0)
-        return pickle.loads(data)
-    return None
+def load_pickle_frames_if_exists(path):
+    """
+    Load all objects that were pickled into the file (one after another, see
+    `append_pickle_file()`) and return them as a list, in order. Return `None`
+    if the file does not exist (or does not contain a single complete
+    frame).
+
+    Appending a frame is not atomic: if that was interrupted, the file ends
+    with a truncated frame. Drop it (from the list and from the file), so
+    that the data of the previous frames can still be used.
+    """
+    if not os.path.exists(path):
+        return None
+
+    log.info("loading data from file: %s", path)
+    filesize = os.path.getsize(path)
+    objs = []
+    with open(path, "rb") as f:
+        while True:
+            frame_start = f.tell()
+            if frame_start == filesize:
+                break
+            try:
+                objs.append(pickle.load(f))
+            except (EOFError, pickle.UnpicklingError) as exc:
+                log.warning(
+                    "%s: truncated pickle frame at byte %s (%s), drop it",
+                    path,
+                    frame_start,
+                    exc,
+                )
+                break
+        log.info(
+            "read %.2f MiB (%s frame(s))", frame_start / 1024.0 / 1024.0, len(objs)
+        )
+
+    if frame_start < filesize:
+        # Cut off the torn tail, so that the next append starts a new frame
+        # right after the last complete one.
+        os.truncate(path, frame_start)
+
+    if not objs:
+        return None
+    return objs
+
+
+def append_pickle_file(obj, path):
+    # Add another pickle frame to the end of the file, leaving the existing
+    # content untouched (not read, not re-serialized).
+    with open(path, "ab") as f:
+        _dump_pickle(obj, f, "append", path)
 
 
 def write_pickle_file(obj, path):
-    data = pickle.dumps(obj)
+    with open(path, "wb") as f:
+        _dump_pickle(obj, f, "persist", path)
+
+
+def _dump_pickle(obj, f, verb, path):
+    # Pickle into the file object: no intermediate `bytes` object holding
+    # the complete serialized data.
+    start = f.tell()
+    pickle.dump(obj, f)
+    size = f.tell() - start
     log.info(
-        "persist %s byte(s) (%.2f MiB) to file %s",
-        len(data),
-        len(data) / 1024.0 / 1024.0,
+        "%s %s byte(s) (%.2f MiB) to file %s",
+        verb,
+        size,
+        size / 1024.0 / 1024.0,
         path,
     )
-    with open(path, "wb") as f:
-        f.write(data)
 
 
 def get_mdtable(header_list, value_matrix):
     """
     Generate table text in Markdown.
+
+    Header cells are centered. Columns with only numeric values are
+    right-aligned, other columns are left-aligned. A "|" in a cell is
+    escaped, so that it does not end the cell.
     """
     if not value_matrix:
         return ""
 
-    tw = pytablewriter.MarkdownTableWriter()
-    tw.stream = StringIO()
-    tw.header_list = header_list
-    tw.value_matrix = value_matrix
-    # Potentially use
-    # writer.align_list = [Align.LEFT, Align.RIGHT, ...]
-    # see https://github.com/thombashi/pytablewriter/issues/2
-    tw.margin = 1
-    tw.write_table()
-    # print(textwrap.indent(tw.stream.getvalue(), '    '))
-    return tw.stream.getvalue()
+    columns = list(zip(*value_matrix))
+    numeric = [
+        all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in col)
+        for col in columns
+    ]
+    header = [_escape_mdtable_cell(h) for h in header_list]
+    cells = [[_escape_mdtable_cell(v) for v in row] for row in value_matrix]
+    widths = [
+        max(len(h), *(len(row[i]) for row in cells)) for i, h in enumerate(header)
+    ]
+
+    def _center(text, width):
+        left = (width - len(text)) // 2
+        return " " * left + text + " " * (width - len(text) - left)
+
+    lines = [
+        "| " + " | ".join(_center(h, w) for h, w in zip(header, widths)) + " |",
+        "|"
+        + "|".join(
+            "-" * (w + 1) + (":" if num else "-") for w, num in zip(widths, numeric)
+        )
+        + "|",
+    ]
+    for row in cells:
+        lines.append(
+            "| "
+            + " | ".join(
+                v.rjust(w) if num else v.ljust(w)
+                for v, w, num in zip(row, widths, numeric)
+            )
+            + " |"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def _escape_mdtable_cell(value):
+    return str(value).replace("|", "\\|")
@@ -33,5 +33,5 @@ setup(
         "Programming Language :: Python :: Implementation :: CPython",
         "Operating System :: POSIX",
     ],
-    install_requires=("pandas", "matplotlib", "pytablewriter", "pybuildkite"),
+    install_requires=("numpy", "pandas>=2.0", "matplotlib", "pybuildkite"),
 )